@@ -27,9 +27,11 @@ A lógica de classificação foi melhorada para ignorar espaços no texto do PDF
   - Paginação automática.
 - **Processamento de Arquivos PDF:**
   - Extração de texto de documentos PDF usando a biblioteca PyMuPDF (fitz).
+  - Extração e classificação em paralelo (ProcessPoolExecutor), sem bloquear o navegador.
+  - Download direto dos PDFs com URL conhecida (requests + cookies do navegador), em paralelo.
 - **Manipulação de Arquivos e Diretórios:**
   - Criação de pastas, renomeação e movimentação de arquivos com 'os' e 'shutil'.
-  - Monitoramento de uma pasta de downloads para identificar novos arquivos.
+  - Monitoramento de uma pasta de downloads (eventos do sistema via watchdog) para identificar novos arquivos.
 - **Boas Práticas de Código:**
   - Código orientado a objetos (OOP).
   - Funções claras e bem documentadas.
@@ -39,287 +41,1031 @@ A lógica de classificação foi melhorada para ignorar espaços no texto do PDF
 """
 
 import time
+import asyncio
+import email.message
+import errno
+import itertools
 import os
+import pickle
+import queue
 import shutil
-import fitz  # PyMuPDF
-import pandas as pd
 import unicodedata
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import closing
 from datetime import date  # Importado para usar a data atual
+from multiprocessing import shared_memory
 from selenium import webdriver
 from selenium.webdriver.edge.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.common.exceptions import (
+    NoSuchElementException, StaleElementReferenceException, TimeoutException, WebDriverException
+)
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import PatternMatchingEventHandler
+except ImportError:  # Sem watchdog, o bot volta a varrer a pasta de downloads periodicamente
+    Observer = None
+    PatternMatchingEventHandler = object
+
+try:
+    import ahocorasick  # pyahocorasick
+except ImportError:  # Sem pyahocorasick, as regras são testadas uma a uma
+    ahocorasick = None
+
+try:
+    import requests
+except ImportError:  # Sem requests, todo PDF é baixado clicando no botão
+    requests = None
+
+# --- FUNÇÕES EXECUTADAS NOS PROCESSOS DO POOL ---
+# Ficam no nível do módulo para poderem ser serializadas (pickle) e enviadas aos processos.
+# Recebem e devolvem apenas caminhos e strings; nenhum objeto do PyMuPDF atravessa processos.
+
+def _montar_tabela_ascii():
+    """Tabela de 256 bytes (latin-1) que converte para maiúsculas e troca as letras acentuadas pela letra sem acento."""
+    tabela = bytearray(range(256))
+    for codigo in range(ord("a"), ord("z") + 1):
+        tabela[codigo] = codigo - 32
+    acentuadas = "ÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑ"
+    sem_acento = "AAAAAEEEEIIIIOOOOOUUUUCN"
+    for origem, destino in zip(acentuadas + acentuadas.lower(), sem_acento * 2):
+        tabela[ord(origem)] = ord(destino)
+    return bytes(tabela)
+
+TABELA_ASCII = _montar_tabela_ascii()
+ESPACOS = b" \t\r\n\x0b\x0c\xa0"
+
+# Use True para voltar à normalização NFKD completa (cobre qualquer acento, mas é bem mais lenta).
+NORMALIZACAO_NFKD = False
+
+def _normalizar_texto(texto):
+    """Remove acentos, caracteres especiais de uma string e a converte para maiúsculas."""
+    if not texto: return ""
+    texto = texto.upper()
+    nfkd_form = unicodedata.normalize('NFKD', texto)
+    return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
+
+def _normalizar_sem_espacos(texto):
+    """Prepara um texto para comparação: maiúsculas, sem acentos e sem espaços ou quebras de linha."""
+    if NORMALIZACAO_NFKD:
+        return "".join(_normalizar_texto(texto).split())
+    # Uma única passada em C sobre os bytes: maiúsculas + remoção de acentos + remoção de espaços
+    return texto.encode("latin-1", "ignore").translate(TABELA_ASCII, ESPACOS).decode("latin-1")
+
+def _abrir_documento(caminho_arquivo):
+    """
+    Abre o PDF com o PyMuPDF. Cada download é lido uma única vez, então o documento é fechado
+    logo depois da classificação (ver _iterar_paginas_normalizadas), antes de o arquivo ser movido.
+    """
+    import fitz  # PyMuPDF, importado só quando o primeiro PDF é lido
+
+    return fitz.open(caminho_arquivo, filetype="pdf")
+
+def _iterar_paginas_normalizadas(caminho_arquivo):
+    """Gera o texto de cada página do PDF já normalizado e sem espaços, uma página por vez."""
+    import fitz  # PyMuPDF (importação tardia, ver _abrir_documento)
+
+    with _abrir_documento(caminho_arquivo) as doc:  # Fechado ao terminar ou ao interromper a leitura
+        for page in doc:
+            # sort=False e sem flags de layout: só interessa a presença das palavras-chave
+            texto_pagina = page.get_text("text", flags=fitz.TEXT_MEDIABOX_CLIP, sort=False)
+            # --- CORREÇÃO (ECAD BUG) ---
+            # Compara o PDF sem espaços, o que corrige casos como "E C A D" ou "Mídia Regional"
+            yield _normalizar_sem_espacos(texto_pagina)
+
+def compilar_regras(regras):
+    """
+    Normaliza as regras de classificação uma única vez.
+    Devolve uma lista [(categoria, caminho_relativo_pasta, agulha)] já na ordem de prioridade:
+    as subcategorias (mais específicas) vêm antes do gatilho geral da sua categoria.
+    """
+    regras_compiladas = []
+    for categoria, regra in regras.items():
+        if isinstance(regra, dict):
+            for sub_cat, sub_palavra_chave in regra["subcategorias"].items():
+                regras_compiladas.append((sub_cat, os.path.join(categoria, sub_cat), _normalizar_sem_espacos(sub_palavra_chave)))
+            regras_compiladas.append((categoria, categoria, _normalizar_sem_espacos(regra.get("gatilho", ""))))
+        elif isinstance(regra, str):
+            regras_compiladas.append((categoria, categoria, _normalizar_sem_espacos(regra)))
+    # Regras vazias nunca devem corresponder
+    return [regra for regra in regras_compiladas if regra[2]]
+
+def montar_automato(regras_compiladas):
+    """
+    Monta um autômato Aho–Corasick com todas as agulhas, para achar qualquer regra em uma única passada
+    pelo texto. Devolve None se o pyahocorasick não estiver instalado (ou se não houver regras).
+    """
+    if ahocorasick is None or not regras_compiladas:
+        return None
+    automato = ahocorasick.Automaton()
+    for prioridade, (categoria, caminho_relativo_pasta, agulha) in enumerate(regras_compiladas):
+        # Agulhas repetidas ficam com a regra de maior prioridade (a que aparece primeiro)
+        if agulha not in automato:
+            automato.add_word(agulha, (prioridade, categoria, caminho_relativo_pasta))
+    automato.make_automaton()
+    return automato
+
+def gerar_funcao_de_busca(regras_compiladas):
+    """
+    Gera, para as regras desta execução, uma função especializada buscar(texto) com um
+    `if "AGULHA" in texto: return (...)` por regra, já na ordem de prioridade e com as constantes
+    embutidas (sem laço, dicionários nem isinstance). Devolve (prioridade, categoria, caminho_relativo_pasta) ou None.
+    """
+    codigo = ["def buscar(texto):"]
+    for prioridade, (categoria, caminho_relativo_pasta, agulha) in enumerate(regras_compiladas):
+        codigo.append(f"    if {agulha!r} in texto: return {(prioridade, categoria, caminho_relativo_pasta)!r}")
+    codigo.append("    return None")
+    namespace = {}
+    exec(compile("\n".join(codigo), "<regras>", "exec"), namespace)
+    return namespace["buscar"]
+
+def _buscar_regra(texto_sem_espacos, buscar, automato=None):
+    """Devolve (prioridade, categoria, caminho_relativo_pasta) da regra mais prioritária presente no texto, ou None."""
+    if automato is None:
+        return buscar(texto_sem_espacos)
+
+    melhor = None
+    for _, regra in automato.iter(texto_sem_espacos):
+        if melhor is None or regra < melhor:
+            melhor = regra
+            if melhor[0] == 0:  # Nenhuma regra tem prioridade maior
+                break
+    return melhor
+
+# Classificador de cada processo do pool (função de busca, autômato, tamanho da cauda entre páginas)
+_classificador_do_processo = (gerar_funcao_de_busca([]), None, 0)
+
+def carregar_classificador(regras_compiladas, automato=None):
+    """Prepara o classificador usado por extrair_e_classificar neste processo."""
+    global _classificador_do_processo
+    # Guarda o fim da página anterior para achar palavras-chave que atravessam a quebra de página
+    tamanho_cauda = max((len(agulha) for _, _, agulha in regras_compiladas), default=1) - 1
+    _classificador_do_processo = (gerar_funcao_de_busca(regras_compiladas), automato, tamanho_cauda)
+
+def _inicializar_processo(nome_memoria, tamanho):
+    """
+    Roda uma vez em cada processo do pool: carrega o classificador já montado pelo processo principal,
+    lendo-o da memória compartilhada em vez de recompilar as regras e o autômato.
+    """
+    memoria = shared_memory.SharedMemory(name=nome_memoria)
+    try:
+        regras_compiladas, automato = pickle.loads(bytes(memoria.buf[:tamanho]))
+    finally:
+        memoria.close()
+    carregar_classificador(regras_compiladas, automato)
+
+def extrair_e_classificar(caminho_arquivo):
+    """
+    Lê o PDF página a página e o classifica (roda em um processo do pool), parando assim que
+    encontra a regra de maior prioridade. Usa o classificador carregado no processo.
+    Devolve (caminho_arquivo, caminho_relativo_pasta, categoria); os dois últimos são None
+    se o PDF não pôde ser lido ou se nenhuma regra correspondeu.
+    """
+    buscar, automato, tamanho_cauda = _classificador_do_processo
+    melhor = None
+    cauda = ""
+    paginas_lidas = 0
+    try:
+        # closing(): ao parar antes da última página, o PDF é fechado na hora
+        with closing(_iterar_paginas_normalizadas(caminho_arquivo)) as paginas:
+            for texto_pagina in paginas:
+                paginas_lidas += 1
+                texto = cauda + texto_pagina
+                regra = _buscar_regra(texto, buscar, automato)
+                if regra is not None and (melhor is None or regra < melhor):
+                    melhor = regra
+                    if melhor[0] == 0:  # Nenhuma outra regra pode ganhar desta
+                        break
+                cauda = texto[-tamanho_cauda:] if tamanho_cauda else ""
+    except Exception as e:
+        print(f"      -> Erro ao ler o PDF: {e}")
+        return caminho_arquivo, None, None
+
+    print(f"    -> Texto analisado de {os.path.basename(caminho_arquivo)} ({paginas_lidas} página(s) lida(s)).")
+    if melhor is None:
+        return caminho_arquivo, None, None
+    _, categoria, caminho_relativo_pasta = melhor
+    print(f"      -> REGRA ENCONTRADA para '{categoria}'")
+    return caminho_arquivo, caminho_relativo_pasta, categoria
+
+# --- SCRIPTS EXECUTADOS NO NAVEGADOR ---
+# Todas as funções usadas no navegador ficam em uma biblioteca (window.__fiscalBot) instalada uma única vez
+# por documento; depois disso cada chamada envia só o nome da função e os argumentos, não o código inteiro.
+# Os seletores CSS chegam como argumentos (FiscalBot.seletores), para ficarem definidos em um só lugar.
+JS_BIBLIOTECA = """
+window.__fiscalBot = {
+    // Botão PDF de uma linha: o primeiro botão cujo texto é exatamente "PDF".
+    botaoPdf(linha, seletor) {
+        return Array.from(linha.querySelectorAll(seletor)).find(b => b.textContent.trim() === "PDF") || null;
+    },
+
+    // Texto das células de uma linha. textContent não força o recálculo de layout (ao contrário de .text/innerText).
+    textosCelulas(linha, seletor) {
+        return Array.from(linha.querySelectorAll(seletor)).map(span => span.textContent.trim());
+    },
+
+    // URL do PDF quando o próprio botão a expõe (data-href/data-url) ou quando ele está diretamente
+    // dentro de um link; null quando o download só acontece pelo clique.
+    // Âncoras ("#...") e links para a própria página não contam: eles não apontam para o arquivo.
+    urlPdf(botao) {
+        const link = botao.parentElement && botao.parentElement.tagName === "A" ? botao.parentElement : null;
+        const valor = (botao.dataset.href || botao.dataset.url || (link && link.getAttribute("href")) || "").trim();
+        if (!valor || valor.startsWith("#")) return null;
+        try {
+            const url = new URL(valor, document.baseURI);
+            url.hash = "";
+            const paginaAtual = new URL(window.location.href);
+            paginaAtual.hash = "";
+            if (url.href === paginaAtual.href) return null;
+            return url.protocol === "http:" || url.protocol === "https:" ? url.href : null;
+        } catch (erro) {
+            return null;
+        }
+    },
+
+    // Linhas de dados da página. O resultado da busca é guardado enquanto o DOM não muda:
+    // um MutationObserver incrementa a versão a cada mudança e só então a busca é refeita.
+    linhas(seletorLinhas) {
+        const cache = this._cacheLinhas || (this._cacheLinhas = {versao: 0, versaoLida: -1, seletor: null, linhas: []});
+        if (!cache.observador) {
+            cache.observador = new MutationObserver(() => cache.versao++);
+            cache.observador.observe(document.body, {childList: true, subtree: true});
+        }
+        if (cache.versaoLida !== cache.versao || cache.seletor !== seletorLinhas) {
+            cache.linhas = Array.from(document.querySelectorAll(seletorLinhas));
+            cache.versaoLida = cache.versao;
+            cache.seletor = seletorLinhas;
+        }
+        return cache.linhas;
+    },
+
+    // Uma linha pelo índice (ou null), para reencontrar um elemento que ficou obsoleto.
+    linha(seletorLinhas, indice) {
+        return this.linhas(seletorLinhas)[indice] || null;
+    },
+
+    // Retrato da página: para cada linha com pelo menos minimoCelulas células (cabeçalhos e linhas vazias
+    // nem saem do navegador), a posição dela na página, o elemento e o botão PDF (que chegam ao Python
+    // como WebElements), o texto das células, se ela tem botão PDF e a URL do PDF (quando existe).
+    snapshotPagina(seletorLinhas, seletorCelulas, seletorBotoes, minimoCelulas) {
+        const retrato = [];
+        this.linhas(seletorLinhas).forEach((linha, indice) => {
+            const celulas = this.textosCelulas(linha, seletorCelulas);
+            if (celulas.length < minimoCelulas) return;
+            const botao = this.botaoPdf(linha, seletorBotoes);
+            retrato.push({
+                indice: indice,
+                elemento: linha,
+                celulas: celulas,
+                temPdf: Boolean(botao),
+                botaoPdf: botao,
+                urlPdf: botao ? this.urlPdf(botao) : null,
+            });
+        });
+        return retrato;
+    },
+
+    // Procura o botão PDF dentro da linha e dá o duplo clique nele.
+    clicarPdf(linha, seletorBotoes) {
+        const botao = this.botaoPdf(linha, seletorBotoes);
+        return botao ? this.duploClique(botao) : false;
+    },
+
+    // Rola até o botão e dispara a mesma sequência de eventos de um duplo clique real
+    // (mousedown/mouseup/click duas vezes, com detail 1 e 2, e depois dblclick).
+    duploClique(botao) {
+        botao.scrollIntoView({block: "center", inline: "nearest"});
+        const evento = (tipo, detail) =>
+            botao.dispatchEvent(new MouseEvent(tipo, {bubbles: true, cancelable: true, view: window, detail: detail, button: 0}));
+        for (const detail of [1, 2]) {
+            evento("mousedown", detail);
+            evento("mouseup", detail);
+            evento("click", detail);
+        }
+        evento("dblclick", 2);
+        return true;
+    },
+
+    // Instala um MutationObserver que marca window.__paginaMudou = true quando a primeira linha de dados
+    // sai da página ou muda de conteúdo (inclusive quando o site reaproveita os mesmos elementos).
+    observarTrocaDePagina(seletorLinhas) {
+        if (window.__observadorPagina) window.__observadorPagina.disconnect();
+        const primeira = document.querySelector(seletorLinhas);
+        window.__paginaMudou = !primeira;
+        if (!primeira) return;
+        const conteudoOriginal = primeira.textContent;
+        window.__observadorPagina = new MutationObserver(() => {
+            if (!primeira.isConnected || primeira.textContent !== conteudoOriginal
+                    || document.querySelector(seletorLinhas) !== primeira) {
+                window.__paginaMudou = true;
+                window.__observadorPagina.disconnect();
+            }
+        });
+        window.__observadorPagina.observe(document.body, {childList: true, subtree: true, characterData: true});
+    },
+
+    // Vai para a próxima página: procura o botão, confere se ele não é o "...", prepara o observador
+    // da troca de página e clica. Devolve {clicou, motivo} ("sem-botao" ou "reticencias" quando não clicou).
+    proximaPagina(seletorLinhas, seletorProxima) {
+        const botao = document.querySelector(seletorProxima);
+        if (!botao) return {clicou: false, motivo: "sem-botao"};
+        if (botao.textContent.includes("...")) return {clicou: false, motivo: "reticencias"};
+        this.observarTrocaDePagina(seletorLinhas);
+        botao.click();
+        return {clicou: true, motivo: null};
+    },
+};
+"""
+
+# Devolvido por JS_CHAMAR quando a biblioteca ainda não existe no documento atual.
+JS_SEM_BIBLIOTECA = "__fiscalBot_ausente__"
+
+# arguments: nome da função da biblioteca, seguido dos argumentos dela.
+JS_CHAMAR = """
+const biblioteca = window.__fiscalBot;
+if (!biblioteca) return "%s";
+return biblioteca[arguments[0]](...Array.prototype.slice.call(arguments, 1));
+""" % JS_SEM_BIBLIOTECA
+
+# Lê a marca deixada por observarTrocaDePagina. Se o documento inteiro foi recarregado,
+# a variável não existe mais e isso também conta como troca de página.
+JS_PAGINA_MUDOU = "return window.__paginaMudou !== false;"
+
+class _ManipuladorDeDownloads(PatternMatchingEventHandler):
+    """Coloca na fila o caminho de cada novo .pdf que aparece na pasta de downloads."""
+    def __init__(self, fila):
+        super().__init__(patterns=["*.pdf"], ignore_directories=True)
+        self.fila = fila
+
+    def on_created(self, event):
+        self.fila.put(event.src_path)
+
+    def on_moved(self, event):
+        # O navegador baixa como ".crdownload" e renomeia para ".pdf" ao terminar
+        if event.dest_path.endswith(".pdf"):
+            self.fila.put(event.dest_path)
 
 class FiscalBot:
     """
     Classe completa para automação do portal Fiscal, incluindo download, análise e organização de PDFs.
     """
-    def __init__(self, driver, pasta_download, pasta_destino, regras_classificacao):
+    COLUNAS_RELATORIO = ['LOJA', 'REFERÊNCIA SAP', 'NÚMERO DUPLIC.', 'DATA DE EMISSÃO', 'VENCIMENTO', 'VALOR', 'ARQUIVO']
+
+    def __init__(self, driver, pasta_download, pasta_destino, regras_classificacao, verbose=False):
         self.driver = driver
+        # Sem espera implícita: find_elements devolve [] na hora e toda espera do bot é explícita
+        self.driver.implicitly_wait(0)
+        self.verbose = verbose  # Mensagens linha a linha (avisos e erros são sempre exibidos)
         self.wait = WebDriverWait(self.driver, 20)
-        self.dados_processados = []
+        # Espera para mudanças rápidas da interface: verifica a cada 50 ms e tolera elementos sendo recriados
+        self.espera_rapida = WebDriverWait(self.driver, 10, poll_frequency=0.05,
+                                           ignored_exceptions=(StaleElementReferenceException, NoSuchElementException))
+        # Troca de página: verifica a mesma marca a cada 50 ms, mas dá à página o mesmo prazo de self.wait
+        self.espera_troca_de_pagina = WebDriverWait(self.driver, 20, poll_frequency=0.05)
+        self.actions = ActionChains(self.driver)  # Reaproveitada a cada clique (reset_actions)
+        self._titulos_abas = {}  # {handle: título}, relido só quando o conjunto de abas muda
+        # Dados do relatório já separados por coluna (montados em um DataFrame só no final)
+        self.dados_por_coluna = {coluna: [] for coluna in self.COLUNAS_RELATORIO}
         
+        # Seletores CSS: avaliados pelo motor de CSS do navegador, bem mais rápido que XPath com contains()
         self.seletores = {
-            "linhas_dados": "//div[contains(@class, 'flora--c-gqwkJN-ihfFBCg-css') and .//input[starts-with(@data-testid, 'select-debit-note-')]]",
-            "botao_pdf": ".//button[text()='PDF']",
-            "celulas_texto": ".//span[contains(@class, 'flora--c-LLdDZ')]",
-            "proxima_pagina": "//button[@aria-current='true']/following-sibling::button[1]"
+            "linhas_dados": "div[class*='flora--c-gqwkJN-ihfFBCg-css']:has(input[data-testid^='select-debit-note-'])",
+            "celulas_texto": "span[class*='flora--c-LLdDZ']",
+            "botao_pdf": "button",  # O texto "PDF" é filtrado em JS_BIBLIOTECA (botaoPdf)
+            "proxima_pagina": "button[aria-current='true'] ~ button"  # O primeiro encontrado é o seguinte
         }
+        # Localizadores (By, seletor) montados uma única vez
+        self.localizadores = {nome: (By.CSS_SELECTOR, seletor) for nome, seletor in self.seletores.items()}
         
         self.pasta_download_temp = pasta_download
+        # PDFs baixados direto pela URL ficam numa subpasta, fora da vigilância da pasta de downloads do navegador
+        self.pasta_downloads_diretos = os.path.join(pasta_download, "downloads_diretos")
         self.pasta_destino_final = pasta_destino
-        self.regras = regras_classificacao
+        # Pastas que já sabemos existir (evita chamar os.makedirs a cada arquivo)
+        self._pastas_garantidas = {pasta_destino}
+        self._regras_compiladas = compilar_regras(regras_classificacao)
+        self._automato = montar_automato(self._regras_compiladas)
+
+        # O classificador é serializado uma única vez em memória compartilhada e lido por cada processo do pool
+        classificador = pickle.dumps((self._regras_compiladas, self._automato))
+        self._memoria_classificador = shared_memory.SharedMemory(create=True, size=len(classificador))
+        self._memoria_classificador.buf[:len(classificador)] = classificador
 
-    def _normalizar_texto(self, texto):
-        """Remove acentos, caracteres especiais de uma string e a converte para maiúsculas."""
-        if not texto: return ""
-        texto = texto.upper()
-        nfkd_form = unicodedata.normalize('NFKD', texto)
-        return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
+        # Pool de processos para extrair/classificar os PDFs enquanto o navegador segue para a próxima linha
+        num_processos = min(os.cpu_count() or 1, 4)
+        self.pool = ProcessPoolExecutor(max_workers=num_processos, initializer=_inicializar_processo,
+                                        initargs=(self._memoria_classificador.name, len(classificador)))
+        self.pendentes = []
+        self.max_pendentes = num_processos * 2
+
+        # Observador da pasta de downloads: o sistema operacional avisa quando um PDF novo aparece
+        self.fila_downloads = queue.Queue()
+        # Downloads já entregues para análise e ainda não movidos: avisos repetidos deles são ignorados
+        self._downloads_entregues = set()
+        self.observador = None
+        if Observer is not None:
+            self.observador = Observer()
+            self.observador.schedule(_ManipuladorDeDownloads(self.fila_downloads), self.pasta_download_temp, recursive=False)
+            self.observador.start()
+        # Sem o observador, a pasta é varrida por data de modificação: só arquivos mais novos que a
+        # marca d'água contam, por isso um download por vez
+        self._marca_dagua_mtime = time.time_ns()
+        self.max_downloads_simultaneos = 4 if self.observador is not None else 1
+
+        # Downloads diretos (sem clique), quando o botão PDF expõe a URL do arquivo
+        self.executor_downloads = ThreadPoolExecutor(max_workers=8)
 
     def navegar_para_aba_correta(self, titulo_alvo):
-        """Encontra e muda para a aba do navegador com o título especificado."""
-        for handle in self.driver.window_handles:
-            self.driver.switch_to.window(handle)
-            if titulo_alvo.lower() in self.driver.title.lower():
-                print(f"Aba correta encontrada e selecionada: '{self.driver.title}'")
-                return True
+        """
+        Encontra e muda para a aba do navegador com o título especificado.
+        Usa os títulos guardados por _titulos_das_abas e confirma o título depois de trocar de aba;
+        se a aba não for encontrada ou o título tiver mudado, relê os títulos uma vez.
+        """
+        alvo = titulo_alvo.lower()
+        for forcar_leitura in (False, True):
+            titulos, recem_lidos = self._titulos_das_abas(forcar_leitura)
+            handle = next((h for h, titulo in titulos.items() if alvo in titulo.lower()), None)
+            if handle is not None:
+                self.driver.switch_to.window(handle)
+                titulo_atual = self.driver.title
+                if alvo in titulo_atual.lower():
+                    print(f"Aba correta encontrada e selecionada: '{titulo_atual}'")
+                    return True
+            if recem_lidos:
+                break
         print(f"\nAVISO: Nenhuma aba com o título '{titulo_alvo}' foi encontrada.")
         return False
 
+    def _titulos_das_abas(self, forcar_leitura=False):
+        """
+        Devolve ({handle: título} de todas as abas, se os títulos acabaram de ser lidos).
+        Os títulos ficam guardados enquanto o conjunto de abas (window_handles) não muda. Eles vêm de uma
+        única chamada CDP (Target.getTargets; no Edge/Chrome o targetId de uma aba é o próprio window handle)
+        e só as abas que não aparecerem lá são visitadas uma a uma.
+        """
+        handles = self.driver.window_handles
+        if not forcar_leitura and self._titulos_abas and set(handles) == self._titulos_abas.keys():
+            return self._titulos_abas, False
+
+        titulos = {}
+        try:
+            for aba in self.driver.execute_cdp_cmd("Target.getTargets", {})["targetInfos"]:
+                if aba["type"] == "page" and aba["targetId"] in handles:
+                    titulos[aba["targetId"]] = aba["title"]
+        except (AttributeError, KeyError, WebDriverException) as cdp_error:
+            print(f"AVISO: Não foi possível listar as abas via CDP ({cdp_error}). Verificando aba por aba...")
+        for handle in handles:
+            if handle not in titulos:
+                self.driver.switch_to.window(handle)
+                titulos[handle] = self.driver.title
+        self._titulos_abas = titulos
+        return titulos, True
+
+    def _instalar_biblioteca_js(self):
+        """
+        Registra a biblioteca JS para ser carregada em todo documento novo da aba (CDP
+        Page.addScriptToEvaluateOnNewDocument) e a carrega também na página atual.
+        """
+        try:
+            self.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": JS_BIBLIOTECA})
+        except (AttributeError, WebDriverException):
+            pass  # Sem CDP, _chamar_js reinstala a biblioteca quando a página for recarregada
+        self.driver.execute_script(JS_BIBLIOTECA)
+
+    def _chamar_js(self, funcao, *argumentos):
+        """Chama uma função da biblioteca JS; se a página foi recarregada sem ela, instala de novo e repete."""
+        resultado = self.driver.execute_script(JS_CHAMAR, funcao, *argumentos)
+        if resultado == JS_SEM_BIBLIOTECA:
+            self.driver.execute_script(JS_BIBLIOTECA)
+            resultado = self.driver.execute_script(JS_CHAMAR, funcao, *argumentos)
+        return resultado
+
     def _processar_pagina_atual(self):
-        """Contém a lógica para processar todas as linhas da página visível."""
-        total_linhas = len(self.driver.find_elements(By.XPATH, self.seletores["linhas_dados"]))
-        print(f"Encontradas {total_linhas} linhas de dados para processar.")
-        
-        for i in range(total_linhas):
-            try:
-                elementos_linha = self.driver.find_elements(By.XPATH, self.seletores["linhas_dados"])
-                linha_atual_element = elementos_linha[i]
-                
-                celulas_texto = [span.text for span in linha_atual_element.find_elements(By.XPATH, self.seletores["celulas_texto"])]
-                
-                if not celulas_texto or len(celulas_texto) < 6:
-                    print(f"  -> Linha {i+1} ignorada (sem dados ou cabeçalho).")
-                    continue
+        """
+        Processa a página visível em três etapas: retrato de todas as linhas (uma chamada ao navegador),
+        cliques nos botões PDF (em série) e registro de todas as linhas da página de uma só vez.
+        """
+        linhas = self._snapshot_pagina_js()
+        print(f"Encontradas {len(linhas)} linhas de dados para processar.")
+
+        registros = asyncio.run(self._processar_linhas(linhas))
+        self._registrar_linhas(registros)
+
+        # Conclui as análises pendentes antes de trocar de página
+        self._drenar_pendentes()
+
+    def _snapshot_pagina_js(self):
+        """
+        Lê a página inteira em uma única chamada ao navegador: uma lista com, para cada linha de dados,
+        {"indice", "elemento", "celulas", "temPdf", "botaoPdf", "urlPdf"}. Linhas com menos células que
+        as colunas do relatório (cabeçalhos) já são descartadas no navegador. Daí em diante o laço roda só em Python.
+        """
+        minimo_celulas = len(self.COLUNAS_RELATORIO) - 1
+        try:
+            return self._chamar_js("snapshotPagina", self.seletores["linhas_dados"], self.seletores["celulas_texto"],
+                                   self.seletores["botao_pdf"], minimo_celulas)
+        except WebDriverException as js_error:
+            print(f"AVISO: Coleta da página via JavaScript falhou ({js_error.msg}). Coletando linha a linha...")
+            elementos_linha = self.driver.find_elements(*self.localizadores["linhas_dados"])
+            retrato = []
+            for indice, linha in enumerate(elementos_linha):
+                celulas = self._celulas_da_linha(linha)
+                if len(celulas) >= minimo_celulas:
+                    # O clique é quem confirma se o botão PDF existe
+                    retrato.append({"indice": indice, "elemento": linha, "celulas": celulas, "temPdf": True})
+            return retrato
 
+    def _celulas_da_linha(self, linha_element):
+        """Texto das células de uma linha em uma única chamada, em vez de um .text por célula."""
+        return self._chamar_js("textosCelulas", linha_element, self.seletores["celulas_texto"])
+
+    async def _processar_linhas(self, linhas):
+        """
+        Produtor/consumidor: enquanto o consumidor espera um download terminar e o envia ao pool,
+        o produtor já clica nas próximas linhas (até max_downloads_simultaneos downloads em andamento).
+        """
+        vagas = asyncio.Semaphore(self.max_downloads_simultaneos)
+        cliques = asyncio.Queue(maxsize=self.max_downloads_simultaneos)
+        consumidor = asyncio.create_task(self._consumir_downloads(cliques, vagas))
+        try:
+            return await self._produzir_cliques(linhas, cliques, vagas)
+        finally:
+            await cliques.put(None)  # Sinal de fim para o consumidor
+            await consumidor
+
+    async def _produzir_cliques(self, linhas, cliques, vagas):
+        """Clica no botão PDF de cada linha e devolve [(células, status do arquivo)] das linhas com dados."""
+        total_linhas = len(linhas)
+        # Uma posição por linha de dados da página, preenchida pelo índice
+        registros = [None] * total_linhas
+        # Nomes usados a cada linha, resolvidos uma única vez fora do laço
+        clicar = self._clicar_e_enfileirar
+        verbose = self.verbose
+        # Linhas cujo PDF tem URL são baixadas direto, em paralelo, com os cookies do navegador
+        sessao = None
+        if requests is not None and any(linha.get("urlPdf") for linha in linhas):
+            sessao = self._criar_sessao_http()
+        downloads_diretos = []
+        for i, linha in enumerate(linhas):
+            celulas_texto = linha["celulas"]
+            if verbose:
                 print(f"Processando linha {i+1}/{total_linhas} | Loja: {celulas_texto[0]}")
-                
-                status_arquivo = "Erro ao clicar"
+
+            status_arquivo = "Erro ao clicar"
+            if not linha["temPdf"]:
+                print(f"  -> AVISO: Botão PDF não encontrado na linha {i+1}.")
+            elif sessao is not None and linha.get("urlPdf"):
+                futuro = self.executor_downloads.submit(self._baixar_pdf_direto, sessao, linha["urlPdf"])
+                downloads_diretos.append((i, linha, asyncio.wrap_future(futuro)))
+                status_arquivo = "Download direto iniciado"
+            else:
+                status_arquivo = await clicar(i, linha, cliques, vagas)
+
+            registros[i] = (celulas_texto, status_arquivo)
+
+        # Os arquivos baixados diretamente seguem pela mesma fila para a análise no pool;
+        # se o download direto falhou, a linha volta para o caminho normal (clique no botão)
+        for i, linha, download in downloads_diretos:
+            caminho_arquivo, status_arquivo = await download
+            if caminho_arquivo:
+                await cliques.put(caminho_arquivo)
+            else:
+                print(f"  -> Download direto da linha {i+1} falhou. Clicando no botão PDF...")
+                status_arquivo = await clicar(i, linha, cliques, vagas)
+            registros[i] = (linha["celulas"], status_arquivo)
+        if sessao is not None:
+            sessao.close()
+        return registros
+
+    async def _clicar_e_enfileirar(self, i, linha, cliques, vagas):
+        """Clica no botão PDF da linha e avisa o consumidor para esperar o download; devolve o status do arquivo."""
+        await vagas.acquire()  # Liberada pelo consumidor quando o download terminar
+        if await asyncio.to_thread(self._tentar_clicar_botao_pdf, linha["elemento"], linha.get("botaoPdf"), linha["indice"]):
+            if self.verbose:
+                print("  -> Botão PDF clicado (duplo). Download em andamento...")
+            await cliques.put(i)
+            return "Download iniciado"
+        vagas.release()
+        return "Erro ao clicar"
+
+    async def _consumir_downloads(self, cliques, vagas):
+        """
+        Para cada clique, espera o download correspondente e o envia para análise no pool.
+        Caminhos de arquivos já baixados diretamente vão para a análise sem espera.
+        """
+        while (item := await cliques.get()) is not None:
+            baixado_diretamente = isinstance(item, str)
+            try:
+                if baixado_diretamente:
+                    await asyncio.to_thread(self._enviar_para_analise, item)
+                else:
+                    await asyncio.to_thread(self._organizar_ultimo_arquivo_baixado)
+            except Exception as download_error:
+                print(f"  -> ERRO ao organizar o download: {download_error}")
+            finally:
+                if not baixado_diretamente:
+                    vagas.release()
+
+    def _criar_sessao_http(self):
+        """Sessão HTTP com os cookies e o User-Agent do navegador, para baixar os PDFs sem passar pela interface."""
+        sessao = requests.Session()
+        sessao.headers["User-Agent"] = self.driver.execute_script("return navigator.userAgent;")
+        for cookie in self.driver.get_cookies():
+            sessao.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+        return sessao
+
+    def _baixar_pdf_direto(self, sessao, url_pdf):
+        """
+        Baixa o PDF pela URL, sem clicar no botão (roda nas threads de executor_downloads).
+        Devolve (caminho do arquivo salvo ou None, status do arquivo para o relatório).
+        """
+        try:
+            resposta = sessao.get(url_pdf, timeout=30)
+        except requests.RequestException as e:
+            print(f"  -> AVISO: Download direto de {url_pdf} falhou: {e}")
+            return None, "Erro no download direto"
+        if resposta.status_code != 200 or not resposta.content.startswith(b"%PDF"):
+            print(f"  -> AVISO: Download direto de {url_pdf} não retornou um PDF (HTTP {resposta.status_code}).")
+            return None, f"Erro no download direto (HTTP {resposta.status_code})"
+
+        # Nome do arquivo: o informado pelo servidor ou, na falta dele, o final da URL
+        cabecalho = email.message.Message()
+        cabecalho["Content-Disposition"] = resposta.headers.get("Content-Disposition", "")
+        nome = os.path.basename(cabecalho.get_filename() or urllib.parse.urlsplit(url_pdf).path) or "nota.pdf"
+        nome_base, extensao = os.path.splitext(nome)
+        if extensao.lower() != ".pdf":
+            nome_base, extensao = nome, ".pdf"
+
+        caminho_criado = None  # Só o arquivo criado aqui pode ser apagado em caso de erro
+        try:
+            self._garantir_pasta(self.pasta_downloads_diretos)
+            for n in itertools.count():
+                # Como o navegador, numera os nomes repetidos: "nota.pdf", "nota (1).pdf", ...
+                nome_arquivo = f"{nome_base}{extensao}" if n == 0 else f"{nome_base} ({n}){extensao}"
+                caminho_arquivo = os.path.join(self.pasta_downloads_diretos, nome_arquivo)
                 try:
-                    botao_pdf = linha_atual_element.find_element(By.XPATH, self.seletores["botao_pdf"])
-                    
-                    self.driver.execute_script("arguments[0].scrollIntoView({block: 'center', inline: 'nearest'});", botao_pdf)
-                    time.sleep(0.5)
-                    
-                    actions = ActionChains(self.driver)
-                    actions.move_to_element(botao_pdf).double_click().perform()
-                    
-                    print(f"  -> Botão PDF clicado (duplo). Aguardando download concluir...")
-                    status_arquivo = "Download iniciado"
-
-                    self._organizar_ultimo_arquivo_baixado()
-
-                except Exception as click_error:
-                    print(f"  -> AVISO: Falha ao clicar no botão da linha {i+1}: {click_error}")
-                
-                dados_para_df = celulas_texto + [status_arquivo]
-                self.dados_processados.append(dados_para_df)
-            
-            except Exception as loop_error:
-                print(f"  -> ERRO inesperado no loop na linha {i+1}: {loop_error}")
+                    with open(caminho_arquivo, "xb") as arquivo:
+                        caminho_criado = caminho_arquivo
+                        arquivo.write(resposta.content)
+                except FileExistsError:
+                    continue
+                print(f"    -> PDF '{nome_arquivo}' baixado diretamente (HTTP {resposta.status_code}).")
+                return caminho_arquivo, f"Download direto (HTTP {resposta.status_code})"
+        except OSError as e:
+            # Nome inválido no sistema, disco cheio, sem permissão...: a linha volta para o clique no botão
+            print(f"  -> AVISO: Não foi possível salvar o PDF de {url_pdf}: {e}")
+            if caminho_criado is not None:
+                try:
+                    os.unlink(caminho_criado)  # Não deixa um arquivo pela metade na pasta
+                except OSError:
+                    pass
+            return None, "Erro no download direto"
+
+    def _tentar_clicar_botao_pdf(self, linha_element, botao_pdf, indice):
+        """
+        Clica no botão PDF da linha; devolve False (após avisar) se o clique não aconteceu.
+        Só falhas do navegador (linha obsoleta, clique interceptado, tempo esgotado...) são tratadas aqui;
+        qualquer outro erro interrompe a execução em vez de gerar uma linha de relatório incorreta.
+        """
+        try:
+            if self._clicar_botao_pdf(linha_element, botao_pdf, indice):
+                return True
+            print(f"  -> AVISO: Botão PDF não encontrado na linha {indice+1}.")
+        except WebDriverException as click_error:
+            print(f"  -> AVISO: Falha ao clicar no botão da linha {indice+1} ({type(click_error).__name__}): {click_error.msg}")
+        return False
+
+    def _clicar_botao_pdf(self, linha_element, botao_pdf, indice):
+        """
+        Clica (duplo) no botão PDF da linha via JavaScript, sem ActionChains nem pausas.
+        Usa o botão devolvido no retrato da página (sem procurá-lo de novo dentro da linha);
+        só busca a linha de novo se ele ficou obsoleto.
+        """
+        try:
+            try:
+                if botao_pdf is not None:
+                    return self._chamar_js("duploClique", botao_pdf)
+                return self._chamar_js("clicarPdf", linha_element, self.seletores["botao_pdf"])
+            except StaleElementReferenceException:
+                # A busca das linhas fica em cache no navegador; só é refeita se o DOM mudou
+                botao_pdf = None
+                linha_element = self._chamar_js("linha", self.seletores["linhas_dados"], indice)
+                if linha_element is None:
+                    return False
+                return self._chamar_js("clicarPdf", linha_element, self.seletores["botao_pdf"])
+        except WebDriverException as js_error:
+            print(f"  -> AVISO: Clique via JavaScript falhou ({js_error.msg}). Tentando com o mouse...")
+            return self._clicar_botao_pdf_com_mouse(linha_element, botao_pdf)
+
+    def _clicar_botao_pdf_com_mouse(self, linha_atual_element, botao_pdf=None):
+        """Alternativa ao clique via JavaScript: rola até o botão e faz um duplo clique real."""
+        if botao_pdf is None:
+            botao_pdf = self._chamar_js("botaoPdf", linha_atual_element, self.seletores["botao_pdf"])
+            if botao_pdf is None:
+                return False
+
+        self.driver.execute_script("arguments[0].scrollIntoView({block: 'center', inline: 'nearest'});", botao_pdf)
+        # Segue assim que o botão estiver clicável, em vez de uma pausa fixa após a rolagem
+        self.espera_rapida.until(EC.element_to_be_clickable(botao_pdf))
+
+        self.actions.reset_actions()
+        self.actions.move_to_element(botao_pdf).double_click().perform()
+        return True
 
     def _organizar_ultimo_arquivo_baixado(self):
-        """Orquestra o processo de análise e organização do arquivo mais recente."""
-        print("    -> Iniciando rotina de organização de arquivo...")
-        
+        """Espera o download e envia o arquivo para análise no pool, sem bloquear o navegador."""
+        if self.verbose:
+            print("    -> Iniciando rotina de organização de arquivo...")
+
         arquivo_recente = self._esperar_e_encontrar_novo_download()
         if not arquivo_recente:
             print("    -> AVISO: Download não concluído ou arquivo não encontrado no tempo limite.")
             return
 
-        texto_pdf = self._extrair_texto_do_pdf(arquivo_recente)
-        if not texto_pdf:
-            print(f"    -> AVISO: Não foi possível ler o conteúdo do arquivo {os.path.basename(arquivo_recente)}. Movendo para destino.")
-            # Move para "arquivos gerais" mesmo se não puder ler
-            self._mover_para_arquivos_gerais(arquivo_recente)
+        self._enviar_para_analise(arquivo_recente)
+
+    def _enviar_para_analise(self, caminho_arquivo):
+        """Envia o arquivo para extração/classificação no pool; acima do limite de pendentes, drena o pool."""
+        self.pendentes.append(self.pool.submit(extrair_e_classificar, caminho_arquivo))
+        if len(self.pendentes) > self.max_pendentes:
+            self._drenar_pendentes()
+
+    def _drenar_pendentes(self):
+        """Aguarda as análises em andamento no pool e move cada arquivo para o seu destino."""
+        if not self.pendentes:
             return
+        print(f"\n    -> Aguardando a análise de {len(self.pendentes)} arquivo(s)...")
+        for futuro in as_completed(self.pendentes):
+            try:
+                caminho_arquivo, caminho_relativo_pasta, categoria = futuro.result()
+            except Exception as e:
+                print(f"      -> ERRO na análise paralela do PDF: {e}")
+                continue
 
-        self._classificar_renomear_e_mover(arquivo_recente, texto_pdf)
+            if caminho_relativo_pasta:
+                movido = self._renomear_e_mover(caminho_arquivo, caminho_relativo_pasta, categoria)
+            else:
+                # Sem regra correspondente (ou PDF ilegível): move para "arquivos gerais"
+                print(f"    -> Nenhuma regra correspondeu a {os.path.basename(caminho_arquivo)}. Movendo para a pasta 'arquivos gerais'.")
+                movido = self._mover_para_arquivos_gerais(caminho_arquivo)
+            if movido:
+                # O navegador pode voltar a usar o mesmo nome em um próximo download
+                self._downloads_entregues.discard(caminho_arquivo)
+        self.pendentes = []
 
     def _esperar_e_encontrar_novo_download(self, timeout=30):
-        """Espera ativamente por um novo arquivo .pdf e verifica se o download terminou."""
-        segundos_passados = 0
-        arquivos_antes = set(os.listdir(self.pasta_download_temp))
-        while segundos_passados < timeout:
-            time.sleep(1)
-            segundos_passados += 1
-            arquivos_depois = set(os.listdir(self.pasta_download_temp))
-            novos_arquivos = arquivos_depois - arquivos_antes
-            
-            for arquivo in novos_arquivos:
-                if arquivo.endswith(".pdf") and not arquivo.endswith(".crdownload"):
-                    caminho_completo = os.path.join(self.pasta_download_temp, arquivo)
-                    try:
-                        tamanho_inicial = os.path.getsize(caminho_completo)
-                        time.sleep(1.5)
-                        tamanho_final = os.path.getsize(caminho_completo)
-                        if tamanho_inicial == tamanho_final and tamanho_final > 0:
-                            print(f"    -> Novo arquivo '{arquivo}' encontrado e download concluído.")
-                            return caminho_completo
-                    except (OSError, FileNotFoundError):
-                        continue
-        return None
+        """Espera o aviso do observador de que um novo .pdf apareceu e confirma que o download terminou."""
+        if self.observador is None:
+            return self._varrer_pasta_por_novo_download(timeout)
+
+        limite = time.monotonic() + timeout
+        while True:
+            try:
+                caminho_completo = self.fila_downloads.get(timeout=max(limite - time.monotonic(), 0))
+            except queue.Empty:
+                return None
+            # Ignora avisos repetidos de arquivos que já foram movidos ou que já estão em análise
+            if caminho_completo in self._downloads_entregues or not os.path.exists(caminho_completo):
+                continue
+
+            situacao = self._esperar_download_estavel(caminho_completo, limite)
+            if situacao is None:
+                print(f"    -> AVISO: O download de '{os.path.basename(caminho_completo)}' não terminou no tempo limite.")
+                return None
+            if situacao:
+                break
+            # O arquivo sumiu (era um arquivo provisório do navegador): passa para o próximo aviso
+
+        self._downloads_entregues.add(caminho_completo)
+        print(f"    -> Novo arquivo '{os.path.basename(caminho_completo)}' encontrado e download concluído.")
+        return caminho_completo
+
+    def _esperar_download_estavel(self, caminho_completo, limite):
+        """
+        Espera (verificando a cada 50 ms) até o arquivo não ter ".crdownload", ter tamanho maior que zero
+        e o mesmo tamanho em duas verificações seguidas. Devolve True quando o download terminou,
+        False se o arquivo sumiu no meio da espera e None se o tempo acabou.
+        """
+        tamanho_anterior = None
+
+        def verificar(_):
+            nonlocal tamanho_anterior
+            if os.path.exists(caminho_completo + ".crdownload"):
+                return False
+            try:
+                tamanho = os.path.getsize(caminho_completo)
+            except FileNotFoundError:
+                return "sumiu"
+            estavel = tamanho > 0 and tamanho == tamanho_anterior
+            tamanho_anterior = tamanho
+            return "concluido" if estavel else False
 
-    def _extrair_texto_do_pdf(self, caminho_arquivo):
-        """Extrai o texto de um arquivo PDF."""
         try:
-            with fitz.open(caminho_arquivo) as doc:
-                texto_completo = ""
-                for page in doc:
-                    texto_completo += page.get_text()
-                print(f"    -> Texto extraído de {os.path.basename(caminho_arquivo)}.")
-                return texto_completo
-        except Exception as e:
-            print(f"      -> Erro ao ler o PDF: {e}")
-            return ""
-            
+            situacao = WebDriverWait(self.driver, max(limite - time.monotonic(), 0), poll_frequency=0.05).until(verificar)
+        except TimeoutException:
+            return None
+        return situacao == "concluido"
+
+    def _varrer_pasta_por_novo_download(self, timeout):
+        """
+        Alternativa sem watchdog: procura, a cada 100 ms, um .pdf modificado depois da marca d'água
+        (data do último download encontrado) cujo tamanho já não muda entre duas verificações.
+        """
+        tamanhos_anteriores = {}
+
+        def download_concluido(_):
+            with os.scandir(self.pasta_download_temp) as entradas:
+                novos_arquivos = []
+                for entrada in entradas:
+                    if entrada.name.endswith(".pdf"):
+                        info = entrada.stat()
+                        if info.st_mtime_ns > self._marca_dagua_mtime:
+                            novos_arquivos.append((info.st_mtime_ns, entrada.path, info.st_size))
+
+            for mtime, caminho_completo, tamanho in sorted(novos_arquivos):
+                if tamanho > 0 and tamanhos_anteriores.get(caminho_completo) == tamanho \
+                        and not os.path.exists(caminho_completo + ".crdownload"):
+                    self._marca_dagua_mtime = mtime
+                    return caminho_completo
+                tamanhos_anteriores[caminho_completo] = tamanho
+            return False
+
+        try:
+            caminho_completo = WebDriverWait(self.driver, timeout, poll_frequency=0.1).until(download_concluido)
+        except TimeoutException:
+            return None
+        print(f"    -> Novo arquivo '{os.path.basename(caminho_completo)}' encontrado e download concluído.")
+        return caminho_completo
+
     def _mover_para_arquivos_gerais(self, caminho_arquivo):
-        """Função auxiliar para mover arquivos para a pasta 'arquivos gerais'."""
+        """Função auxiliar para mover arquivos para a pasta 'arquivos gerais'. Devolve True se o arquivo foi movido."""
         try:
             # Cria o caminho para a pasta "arquivos gerais" dentro da pasta de destino final (que já tem a data)
             pasta_arquivos_gerais = os.path.join(self.pasta_destino_final, "arquivos gerais")
             
             # Garante que essa pasta exista
-            os.makedirs(pasta_arquivos_gerais, exist_ok=True)
+            self._garantir_pasta(pasta_arquivos_gerais)
             
-            # Move o arquivo para lá
-            shutil.move(caminho_arquivo, pasta_arquivos_gerais)
-            print(f"    -> Arquivo movido para: {pasta_arquivos_gerais}")
-        except Exception as e:
+            # Move o arquivo para lá (sem sobrescrever um arquivo de mesmo nome)
+            caminho_final = self._mover_rapido(caminho_arquivo, os.path.join(pasta_arquivos_gerais, os.path.basename(caminho_arquivo)))
+            print(f"    -> Arquivo movido para: {caminho_final}")
+            return True
+        except OSError as e:
             print(f"      -> ERRO ao mover arquivo para 'arquivos gerais': {e}")
+            return False
 
-    def _classificar_renomear_e_mover(self, caminho_arquivo, texto_pdf):
-        """Compara o texto normalizado com as regras e move o arquivo."""
-        texto_pdf_normalizado = self._normalizar_texto(texto_pdf)
-        
-        # --- INÍCIO DA CORREÇÃO (ECAD BUG) ---
-        # Cria uma versão do texto do PDF sem espaços para uma correspondência mais robusta
-        # Isso corrige casos como "E C A D" ou "Mídia Regional"
-        texto_pdf_sem_espacos = texto_pdf_normalizado.replace(" ", "")
-        # --- FIM DA CORREÇÃO (ECAD BUG) ---
+    def _garantir_pasta(self, pasta):
+        """Cria a pasta se necessário, consultando o disco apenas na primeira vez em que ela é usada."""
+        if pasta not in self._pastas_garantidas:
+            os.makedirs(pasta, exist_ok=True)
+            self._pastas_garantidas.add(pasta)
 
-        print("    -> Verificando regras de classificação...")
-        
-        categoria_final_para_nome = None
-        caminho_relativo_pasta = None
-
-        for categoria, regra in self.regras.items():
-            if isinstance(regra, dict):
-                sub_categoria_encontrada = None
-                # PRIMEIRO, procura pelas subcategorias que são mais específicas
-                for sub_cat, sub_palavra_chave in regra["subcategorias"].items():
-                    # Remove espaços da regra para a comparação
-                    sub_chave_normalizada = self._normalizar_texto(sub_palavra_chave).replace(" ", "")
-                    # print(f"      - Testando sub-regra '{sub_cat}'. Procurando por: '{sub_chave_normalizada}'...")
-                    
-                    # Compara a regra (sem espaços) com o PDF (sem espaços)
-                    if sub_chave_normalizada in texto_pdf_sem_espacos: 
-                        print(f"      -> Subcategoria encontrada: '{sub_cat}'")
-                        sub_categoria_encontrada = sub_cat
-                        break
-                
-                if sub_categoria_encontrada:
-                    caminho_relativo_pasta = os.path.join(categoria, sub_categoria_encontrada)
-                    categoria_final_para_nome = sub_categoria_encontrada
-                    break
-                
-                # SE NÃO ACHOU subcategoria, procura pelo gatilho geral
-                # Remove espaços da regra para a comparação
-                gatilho_normalizado = self._normalizar_texto(regra.get("gatilho", "")).replace(" ", "")
-                # print(f"      - Testando gatilho '{categoria}'. Procurando por: '{gatilho_normalizado}'...")
-                
-                if gatilho_normalizado and gatilho_normalizado in texto_pdf_sem_espacos: # Compara com PDF sem espaços
-                    print(f"      -> GATILHO ENCONTRADO para '{categoria}'.")
-                    caminho_relativo_pasta = categoria
-                    categoria_final_para_nome = categoria
-                    break
-            
-            elif isinstance(regra, str):
-                # Remove espaços da regra para a comparação
-                regra_normalizada = self._normalizar_texto(regra).replace(" ", "")
-                # print(f"      - Testando regra simples '{categoria}'. Procurando por: '{regra_normalizada}'...")
-                
-                if regra_normalizada and regra_normalizada in texto_pdf_sem_espacos: # Compara com PDF sem espaços
-                    print(f"      -> REGRA ENCONTRADA para '{categoria}'")
-                    caminho_relativo_pasta = categoria
-                    categoria_final_para_nome = categoria
-                    break
+    def _mover_rapido(self, origem, destino):
+        """
+        Move o arquivo com uma simples renomeação (os.replace) quando origem e destino estão no mesmo disco.
+        Entre discos diferentes, copia com shutil.copyfile (cópia feita pelo sistema operacional) e apaga a origem.
+        Nunca sobrescreve: se o destino já existir, o nome ganha um sufixo " (n)". Devolve o caminho final.
+        """
+        destino = self._destino_livre(destino)
+        try:
+            os.replace(origem, destino)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.copyfile(origem, destino)
+            os.unlink(origem)
+        return destino
 
-        if caminho_relativo_pasta:
-            try:
-                pasta_destino_final_abs = os.path.join(self.pasta_destino_final, caminho_relativo_pasta)
-                os.makedirs(pasta_destino_final_abs, exist_ok=True)
-                nome_base, extensao = os.path.splitext(os.path.basename(caminho_arquivo))
-                novo_nome = f"{nome_base}_{categoria_final_para_nome}{extensao}"
-                caminho_final_arquivo = os.path.join(pasta_destino_final_abs, novo_nome)
-                shutil.move(caminho_arquivo, caminho_final_arquivo)
-                print(f"    -> Arquivo classificado como '{categoria_final_para_nome}' e movido para: {pasta_destino_final_abs}")
-            except Exception as e:
-                print(f"      -> ERRO ao mover/renomear arquivo: {e}")
-        else:
-            # --- LÓGICA 'arquivos gerais' ---
-            print("    -> Nenhuma regra correspondeu. Movendo para a pasta 'arquivos gerais'.")
-            self._mover_para_arquivos_gerais(caminho_arquivo)
-            # --- FIM DA LÓGICA ---
+    @staticmethod
+    def _destino_livre(destino):
+        """Primeiro caminho livre entre "nome.pdf", "nome (1).pdf", "nome (2).pdf", ... (como o navegador faz)."""
+        nome_base, extensao = os.path.splitext(destino)
+        for n in itertools.count():
+            caminho = destino if n == 0 else f"{nome_base} ({n}){extensao}"
+            if not os.path.exists(caminho):
+                return caminho
+
+    def _renomear_e_mover(self, caminho_arquivo, caminho_relativo_pasta, categoria):
+        """Renomeia o arquivo com a categoria encontrada e o move para a pasta correspondente. Devolve True se o arquivo foi movido."""
+        try:
+            pasta_destino_final_abs = os.path.join(self.pasta_destino_final, caminho_relativo_pasta)
+            self._garantir_pasta(pasta_destino_final_abs)
+            nome_base, extensao = os.path.splitext(os.path.basename(caminho_arquivo))
+            novo_nome = f"{nome_base}_{categoria}{extensao}"
+            caminho_final_arquivo = os.path.join(pasta_destino_final_abs, novo_nome)
+            caminho_final_arquivo = self._mover_rapido(caminho_arquivo, caminho_final_arquivo)
+            print(f"    -> Arquivo classificado como '{categoria}' e movido para: {caminho_final_arquivo}")
+            return True
+        except OSError as e:
+            print(f"      -> ERRO ao mover/renomear arquivo: {e}")
+            return False
 
     def _ir_para_proxima_pagina(self):
-        """Clica no botão de próxima página e espera o recarregamento."""
+        """Clica no botão de próxima página e espera o recarregamento (busca, verificação e clique em uma só chamada)."""
         print("\nProcessamento da página concluído. Verificando próxima página...")
-        try:
-            elemento_referencia = self.driver.find_element(By.XPATH, self.seletores["linhas_dados"])
-            proxima_pagina_btn = self.driver.find_element(By.XPATH, self.seletores["proxima_pagina"])
-            if "..." in proxima_pagina_btn.text:
+        resultado = self._chamar_js("proximaPagina", self.seletores["linhas_dados"], self.seletores["proxima_pagina"])
+        if not resultado["clicou"]:
+            if resultado["motivo"] == "reticencias":
                 print("Fim das páginas sequenciais. Encerrando.")
-                return False
-            print("Próxima página encontrada. Clicando...")
-            proxima_pagina_btn.click()
-            self.wait.until(EC.staleness_of(elemento_referencia))
-            return True
-        except NoSuchElementException:
-            print("Não há mais botões de próxima página. Automação concluída.")
+            else:
+                print("Não há mais botões de próxima página. Automação concluída.")
             return False
+        print("Próxima página clicada. Aguardando o carregamento...")
+        # O próprio navegador avisa quando as linhas mudam; aqui só lemos essa marca a cada 50 ms
+        try:
+            self.espera_troca_de_pagina.until(lambda driver: driver.execute_script(JS_PAGINA_MUDOU))
+        except TimeoutException:
+            # Encerra a paginação sem perder o que já foi coletado (o relatório ainda é gerado)
+            print("AVISO: A próxima página não carregou no tempo limite. Encerrando a paginação.")
+            return False
+        return True
+
+    def _registrar_linhas(self, registros):
+        """
+        Guarda os dados das linhas processadas de uma página, coluna a coluna (a última coluna é o status
+        do arquivo), com um único extend por coluna. Cada linha é cortada/completada com "" para ter
+        exatamente uma célula por coluna do relatório.
+        """
+        if not registros:
+            return
+        num_celulas = len(self.COLUNAS_RELATORIO) - 1
+        linhas = []
+        for celulas_texto, status_arquivo in registros:
+            celulas = celulas_texto[:num_celulas]
+            linhas.append(celulas + [""] * (num_celulas - len(celulas)) + [status_arquivo])
+        for coluna, valores in zip(self.COLUNAS_RELATORIO, zip(*linhas)):
+            self.dados_por_coluna[coluna].extend(valores)
 
     def gerar_relatorio_final(self):
         """Cria e exibe o DataFrame do Pandas com todos os dados coletados."""
-        if self.dados_processados:
+        import pandas as pd  # Importado só aqui: é pesado e só é usado no relatório final
+
+        total_linhas = len(self.dados_por_coluna["ARQUIVO"])
+        if total_linhas:
             print(f"\n--- RELATÓRIO FINAL ---")
-            print(f"Sucesso! {len(self.dados_processados)} linhas foram processadas no total.")
-            colunas = ['LOJA', 'REFERÊNCIA SAP', 'NÚMERO DUPLIC.', 'DATA DE EMISSÃO', 'VENCIMENTO', 'VALOR', 'ARQUIVO']
-            df = pd.DataFrame(self.dados_processados)
-            df.columns = colunas[:len(df.columns)]
+            print(f"Sucesso! {total_linhas} linhas foram processadas no total.")
+            # Tudo texto de uma vez (sem inferência de tipo coluna a coluna); depois só as conversões necessárias
+            df = pd.DataFrame(self.dados_por_coluna, columns=self.COLUNAS_RELATORIO, dtype="string")
+
+            # Tipos adequados: categorias para textos repetidos, números e datas de verdade
+            df["LOJA"] = df["LOJA"].astype("category")
+            df["ARQUIVO"] = df["ARQUIVO"].astype("category")
+            # Valores no formato brasileiro (ex: "R$ 1.234,56")
+            texto_valor = df["VALOR"]
+            valores = texto_valor.str.replace(r"[^\d,-]", "", regex=True).str.replace(",", ".", regex=False)
+            df["VALOR"] = pd.to_numeric(valores, errors="coerce")
+            textos_originais = {"VALOR": texto_valor}
+            for coluna in ("DATA DE EMISSÃO", "VENCIMENTO"):
+                textos_originais[coluna] = df[coluna]
+                df[coluna] = pd.to_datetime(df[coluna], format="%d/%m/%Y", errors="coerce", cache=True)
+
             print(df.to_string()) # .to_string() garante que todo o df seja impresso
 
+            # Valores preenchidos que não puderam ser convertidos aparecem como NaN/NaT acima: mostra o texto original
+            for coluna, texto in textos_originais.items():
+                falhas = df[coluna].isna() & texto.fillna("").str.strip().ne("")
+                if falhas.any():
+                    print(f"\nAVISO: {int(falhas.sum())} valor(es) da coluna '{coluna}' em formato inesperado "
+                          f"(exibidos como vazios acima). Texto original:")
+                    print(texto[falhas].to_string())
+
     def executar(self):
         """Método principal que orquestra toda a automação."""
-        if not self.navegar_para_aba_correta(TITULO_DA_PAGINA_ALVO):
-            return
-        pagina_atual = 1
-        while True:
-            print(f"\n--- PROCESSANDO PÁGINA {pagina_atual} ---")
-            try:
-                self.wait.until(EC.presence_of_element_located((By.XPATH, self.seletores["linhas_dados"])))
-            except TimeoutException:
-                print("Tempo esgotado. Nenhuma linha de dados encontrada nesta página. Encerrando.")
-                break
-            self._processar_pagina_atual()
-            if not self._ir_para_proxima_pagina():
-                break
-            pagina_atual += 1
-        self.gerar_relatorio_final()
+        try:
+            if not self.navegar_para_aba_correta(TITULO_DA_PAGINA_ALVO):
+                return
+            self._instalar_biblioteca_js()
+            pagina_atual = 1
+            while True:
+                print(f"\n--- PROCESSANDO PÁGINA {pagina_atual} ---")
+                try:
+                    self.wait.until(EC.presence_of_element_located(self.localizadores["linhas_dados"]))
+                except TimeoutException:
+                    print("Tempo esgotado. Nenhuma linha de dados encontrada nesta página. Encerrando.")
+                    break
+                self._processar_pagina_atual()
+                if not self._ir_para_proxima_pagina():
+                    break
+                pagina_atual += 1
+            self.gerar_relatorio_final()
+        finally:
+            self.fechar()
+
+    def fechar(self):
+        """Libera os recursos auxiliares (pool de processos, memória compartilhada e observador da pasta de downloads)."""
+        self.executor_downloads.shutdown()
+        self._drenar_pendentes()
+        self.pool.shutdown()
+        self._memoria_classificador.close()
+        self._memoria_classificador.unlink()
+        if self.observador is not None:
+            self.observador.stop()
+            self.observador.join()
 
 # --- BLOCO PRINCIPAL DE EXECUÇÃO ---
 if __name__ == "__main__":
@@ -358,6 +1104,10 @@ if __name__ == "__main__":
             }
         }
     }
+
+    # 4. Mostrar o andamento linha a linha ("Processando linha i/N | Loja: ...")?
+    #    Avisos e erros são exibidos sempre.
+    VERBOSE = False
     # ========================================================================
     
     print("Iniciando automação...")
@@ -374,7 +1124,7 @@ if __name__ == "__main__":
         
         driver = webdriver.Edge(options=edge_options)
         
-        bot = FiscalBot(driver, PASTA_DOWNLOAD_TEMP, PASTA_DESTINO_FINAL, REGRAS_DE_CLASSIFICACAO)
+        bot = FiscalBot(driver, PASTA_DOWNLOAD_TEMP, PASTA_DESTINO_FINAL, REGRAS_DE_CLASSIFICACAO, verbose=VERBOSE)
         
         bot.executar()
 